@@ -1,6 +1,7 @@
 # Adapted from SwinTransformer
 
 import os
+import json
 import yaml
 from yacs.config import CfgNode as CN
 
@@ -335,19 +336,29 @@ _C.SEARCH_HYPERPARAMETERS.EPOCH_RANGE = None
 
 
 
+def _load_cfg_dict(cfg_file):
+    with open(cfg_file, 'r') as f:
+        text = f.read()
+    # Generated configs are written as JSON, which is a subset of YAML and much
+    # faster to parse; hand-written configs fall back to the YAML parser.
+    try:
+        return json.loads(text)
+    except ValueError:
+        return yaml.safe_load(text)
+
+
 def _update_config_from_file(config, cfg_file):
     config.defrost()
-    with open(cfg_file, 'r') as f:
-        yaml_cfg = yaml.load(f, Loader=yaml.FullLoader)
+    cfg_dict = _load_cfg_dict(cfg_file)
 
     #递归找base file
-    for cfg in yaml_cfg.setdefault('BASE', ['']):
+    for cfg in cfg_dict.get('BASE', ['']):
         if cfg:
             _update_config_from_file(
                 config, os.path.join(os.path.dirname(cfg_file), cfg)
             )
     print('=> merge config from {}'.format(cfg_file))
-    config.merge_from_file(cfg_file)
+    config.merge_from_other_cfg(CN(cfg_dict))
     config.freeze()
 
 
@@ -16,6 +16,7 @@
 import logging
 import os
 import json
+from collections import deque
 
 class Synset(object):
   """A Synset object."""
@@ -41,31 +42,56 @@ def get_node_ancestors(synset):
     ancestors: A set of Synsets
   """
   ancestors = set()
-  # In the following line, synset.parents already is a set but we create a copy
-  # of it instead of using synset.parents directly as later we are 'popping'
-  # elements from this set, which would otherwise result to permanently removing
-  # parents of synset which is undesirable.
-  to_visit = set(synset.parents)
-  visited = set()
+  # A worklist of nodes still to be expanded. Each node is expanded at most once
+  # since ancestors doubles as the visited set, so the traversal is O(V + E).
+  to_visit = deque(synset.parents)
   while to_visit:
     ancestor = to_visit.pop()
+    if ancestor in ancestors:
+      continue
     ancestors.add(ancestor)
-    visited.add(ancestor)
-    # Same as in the comment above, we create a copy of ancestor.parents
-    to_visit = to_visit | set(ancestor.parents) - visited
+    to_visit.extend(ancestor.parents)
   return ancestors
 
-def get_ancestors(synsets):
+def build_ancestor_index(synsets):
+  """Create a dict mapping synsets and all their ancestors to their ancestors.
+  The ancestor set of each node is computed once, from the ancestor sets of
+  its parents, so internal nodes shared by many synsets are only expanded once.
+  Args:
+    synsets: A list of Synsets.
+  Returns:
+    A dict mapping each Synset in synsets, and each of their ancestors, to the
+    frozenset of its ancestors.
+  """
+  index = {}
+  for s in synsets:
+    # Iterative post-order DFS: a node is resolved once all its parents are.
+    stack = [s]
+    while stack:
+      n = stack[-1]
+      if n in index:
+        stack.pop()
+        continue
+      unresolved = [p for p in n.parents if p not in index]
+      if unresolved:
+        stack.extend(unresolved)
+        continue
+      stack.pop()
+      index[n] = frozenset(n.parents).union(*(index[p] for p in n.parents))
+  return index
+
+def get_ancestors(synsets, ancestor_index=None):
   """Create a set consisting of all and only the ancestors of leaves.
   Args:
     synsets: A list of Synsets.
+    ancestor_index: Optionally, a dict as returned by build_ancestor_index
+      that covers synsets.
   Returns:
     A set of Synsets.
   """
-  all_ancestors = set()
-  for s in synsets:
-    all_ancestors = all_ancestors | get_node_ancestors(s)
-  return all_ancestors
+  if ancestor_index is None:
+    ancestor_index = build_ancestor_index(synsets)
+  return set().union(*(ancestor_index[s] for s in synsets))
 
 def isolate_graph(nodes):
   """Remove links between Synsets in nodes and Synsets that are not in nodes.
@@ -76,18 +102,20 @@ def isolate_graph(nodes):
   Args:
     nodes: A set of Synsets
   """
+  if not isinstance(nodes, (set, frozenset)):
+    nodes = set(nodes)
   for n in nodes:
-    n.children = list(nodes & set(n.children))
-    n.parents = list(nodes & set(n.parents))
+    n.children = {c for c in n.children if c in nodes}
+    n.parents = {p for p in n.parents if p in nodes}
 
 def isolate_node(node):
   """Isolate node from its children and parents by breaking those links."""
   for p in node.parents:
-    p.children.remove(node)
+    p.children.discard(node)
   for c in node.children:
-    c.parents.remove(node)
-  node.children = []
-  node.parents = []
+    c.parents.discard(node)
+  node.children = set()
+  node.parents = set()
 
 def collapse(nodes):
   """Collapse any nodes that only have a single child.
@@ -97,35 +125,37 @@ def collapse(nodes):
     nodes: A set of Synsets.
   Returns:
     A set containing the Synsets in nodes that were not collapsed, with
-    potentially modified children and parents lists due to collapsing other
+    potentially modified children and parents sets due to collapsing other
     synsets.
   """
-
-  def collapse_once(nodes):
-    """Perform a pass of the collapsing as described above."""
-    num_collapsed = 0
-    non_collapsed_nodes = set()
-    for n in nodes:
-      if len(n.children) == 1:
-        # attach the only child to all of n's parents
-        n.children[0].parents += n.parents
-        for p in n.parents:
-          p.children.append(n.children[0])
-
-        # Remove all connections to and from n
-        isolate_node(n)
-
-        num_collapsed += 1
-      else:
-        non_collapsed_nodes.add(n)
-
-    assert len(nodes) - len(non_collapsed_nodes) == num_collapsed
-    return non_collapsed_nodes, num_collapsed
-
-  nodes, num_collapsed = collapse_once(nodes)
-  while num_collapsed:
-    nodes, num_collapsed = collapse_once(nodes)
-  return nodes
+  non_collapsed_nodes = set(nodes)
+  # Worklist of nodes that may have to be collapsed. Initially every node is a
+  # candidate; afterwards only the parents of a collapsed node can change.
+  pending = deque(nodes)
+  queued = set(nodes)
+  while pending:
+    n = pending.popleft()
+    queued.discard(n)
+    if len(n.children) != 1:
+      continue
+    # attach the only child to all of n's parents. Parents that already reach
+    # the child through another path do not get a duplicate edge, since links
+    # are stored in sets.
+    child = next(iter(n.children))
+    parents = list(n.parents)
+    child.parents.update(parents)
+    for p in parents:
+      p.children.add(child)
+
+    # Remove all connections to and from n
+    isolate_node(n)
+    non_collapsed_nodes.discard(n)
+
+    for p in parents:
+      if p not in queued:
+        pending.append(p)
+        queued.add(p)
+  return non_collapsed_nodes
 
 def get_leaves(nodes):
   """Return a list containing the leaves of the graph defined by nodes."""
@@ -136,6 +166,11 @@ def get_leaves(nodes):
   return leaves
 
 
+def build_wnid_index(synsets):
+  """Return a dict mapping the WordNet id of each Synset in synsets to it."""
+  return {s.wn_id: s for s in synsets}
+
+
 def get_synsets_from_ids(wn_ids, synsets):
   """Finds the Synsets in synsets whose WordNet id's are in wn_ids.
   Args:
@@ -145,15 +180,10 @@ def get_synsets_from_ids(wn_ids, synsets):
     A dict mapping each WordNet id in wn_ids to the corresponding Synset.
   """
   wn_ids = set(wn_ids)
-  requested_synsets = {}
-  for s in synsets:
-    if s.wn_id in wn_ids:
-      requested_synsets[s.wn_id] = s
-
-  found = set(requested_synsets.keys())
-  assert found == wn_ids, ('Did not find synsets for ids: {}.'.format(wn_ids -
-                                                                      found))
-  return requested_synsets
+  index = build_wnid_index(synsets)
+  missing = wn_ids - index.keys()
+  assert not missing, 'Did not find synsets for ids: {}.'.format(missing)
+  return {wn_id: index[wn_id] for wn_id in wn_ids}
 
 def get_spanning_leaves(nodes):
   """Get the leaves that each node in nodes can reach.
@@ -168,16 +198,26 @@ def get_spanning_leaves(nodes):
     spanning_leaves: a dict mapping Synset instances to the set of leaf Synsets
       that are their descendants.
   """
-  # First find the leaves
-  leaves = get_leaves(nodes)
-
-  # dict mapping WordNet id's to the list of leaf Synsets they span
+  # dict mapping Synsets to the set of leaf Synsets they span. The set of a node
+  # is the union of the sets of its children, so resolve nodes in post-order.
   spanning_leaves = {}
-  for n in nodes:
-    spanning_leaves[n] = set()
-    for l in leaves:
-      if is_descendent(l, n) or l == n:
-        spanning_leaves[n].add(l)
+  for s in nodes:
+    stack = [s]
+    while stack:
+      n = stack[-1]
+      if n in spanning_leaves:
+        stack.pop()
+        continue
+      unresolved = [c for c in n.children if c not in spanning_leaves]
+      if unresolved:
+        stack.extend(unresolved)
+        continue
+      stack.pop()
+      if n.children:
+        spanning_leaves[n] = set().union(
+            *(spanning_leaves[c] for c in n.children))
+      else:
+        spanning_leaves[n] = {n}
   return spanning_leaves
 
 
@@ -194,9 +234,13 @@ def get_num_spanning_images(spanning_leaves, num_leaf_images):
     num_images: a dict that maps each node in the sampling graph to the number
       of images in the leaves that it spans.
   """
+  # Resolve the image count of each leaf once, rather than once per ancestor.
+  leaf_counts = {
+      l: num_leaf_images[l.wn_id] for l in set().union(*spanning_leaves.values())
+  }
   num_images = {}
   for node, leaves in spanning_leaves.items():
-    num_images[node] = sum([num_leaf_images[l.wn_id] for l in leaves])
+    num_images[node] = sum(map(leaf_counts.__getitem__, leaves))
   return num_images
 
 
@@ -220,12 +264,13 @@ def create_sampling_graph(synsets, root=None):
     A set of the Synsets of the DAG.
   """
   # Get the set of Synsets containing all and only the ancestors of synsets.
-  nodes = get_ancestors(synsets)
+  ancestor_index = build_ancestor_index(synsets)
+  nodes = get_ancestors(synsets, ancestor_index)
 
   if root is not None:
     # Remove from the ancestors nodes that aren't the root or descendents of it.
     nodes_to_remove = [
-        n for n in nodes if not (root == n or is_descendent(n, root))
+        n for n in nodes if not (root == n or root in ancestor_index[n])
     ]
     nodes = nodes - set(nodes_to_remove)
 
@@ -276,22 +321,22 @@ def propose_valid_test_roots(spanning_leaves,
     synset, leaves = synset_and_leaves
     return (len(leaves), synset.wn_id)
 
-  spanning_leaves_sorted = sorted(six.iteritems(spanning_leaves), key=_sort_key)
-  spanning_leaves_sorted.reverse()
+  spanning_leaves_sorted = sorted(
+      spanning_leaves.items(), key=_sort_key, reverse=True)
 
   # Get the candidate roots for the validation and test sub-graphs, by finding
   # the nodes whose number of spanning leaves are within the
   # allowed margin.
+  low_limit_valid = desired_num_valid_classes - margin
+  high_limit_valid = desired_num_valid_classes + margin
+  low_limit_test = desired_num_test_classes - margin
+  high_limit_test = desired_num_test_classes + margin
   valid_candidates, test_candidates = [], []
   for s, leaves in spanning_leaves_sorted:
     num_leaves = len(leaves)
-    low_limit_valid = desired_num_valid_classes - margin
-    high_limit_valid = desired_num_valid_classes + margin
-    if low_limit_valid < num_leaves and num_leaves < high_limit_valid:
+    if low_limit_valid < num_leaves < high_limit_valid:
       valid_candidates.append(s)
-    low_limit_test = desired_num_test_classes - margin
-    high_limit_test = desired_num_test_classes + margin
-    if low_limit_test < num_leaves and num_leaves < high_limit_test:
+    if low_limit_test < num_leaves < high_limit_test:
       test_candidates.append(s)
 
   if not valid_candidates or not test_candidates:
@@ -359,7 +404,9 @@ def get_class_splits(spanning_leaves, valid_test_roots=None, **kwargs):
   # classes assigned to these splits. This is addressed below by randomly
   # assigning each overlapping leaf to either validation or test classes
   # (roughly equally).
-  overlap = [s for s in valid_wn_ids if s in test_wn_ids]
+  # Sorted so that the alternating assignment does not depend on the iteration
+  # order of the sets, which varies with string hash randomization.
+  overlap = sorted(valid_wn_ids & test_wn_ids)
   logging.info('Size of overlap: %d leaves', len(overlap))
   assign_to_valid = True
   for s in overlap:
@@ -370,12 +417,12 @@ def get_class_splits(spanning_leaves, valid_test_roots=None, **kwargs):
     assign_to_valid = not assign_to_valid
 
   # Training classes are all the remaining ones that are not already assigned
-  leaves = get_leaves(spanning_leaves.keys())
-  train_wn_ids = set([
-      s.wn_id
-      for s in leaves
-      if s.wn_id not in valid_wn_ids and s.wn_id not in test_wn_ids
-  ])
+  # A node only spans itself if it is a leaf, so the leaves can be read off
+  # spanning_leaves without rescanning the children of every node.
+  all_leaf_wn_ids = {
+      s.wn_id for s, s_leaves in spanning_leaves.items() if s in s_leaves
+  }
+  train_wn_ids = all_leaf_wn_ids - valid_wn_ids - test_wn_ids
 
   split_classes = {
       'train': train_wn_ids,
@@ -418,12 +465,16 @@ def init_split_subgraphs(class_splits, spanning_leaves, valid_test_roots):
   valid_root_wn_id = valid_test_roots['valid'].wn_id
   test_root_wn_id = valid_test_roots['test'].wn_id
 
-  # Get 3 full copies of the graph that will be modified downstream.
-  graph_copy_train, _ = copy_graph(spanning_leaves.keys())
-  graph_copy_valid, valid_root = copy_graph(spanning_leaves.keys(),
-                                            valid_root_wn_id)
-  graph_copy_test, test_root = copy_graph(spanning_leaves.keys(),
-                                          test_root_wn_id)
+  # Get 3 full copies of the graph that will be modified downstream. The
+  # nodes and edges of the original graph are only enumerated once.
+  nodes = spanning_leaves.keys()
+  words = {s.wn_id: s.words for s in nodes}
+  edges = _enumerate_edges(nodes)
+  graph_copy_train, _ = copy_graph_from_edges(words, edges)
+  graph_copy_valid, valid_root = copy_graph_from_edges(words, edges,
+                                                       valid_root_wn_id)
+  graph_copy_test, test_root = copy_graph_from_edges(words, edges,
+                                                     test_root_wn_id)
 
   # Get the nodes of each copy that correspond to the splits' assigned classes.
   train_classes = set([s for s in graph_copy_train if s.wn_id in train_wn_ids])
@@ -454,21 +505,43 @@ def copy_graph(nodes, root_wn_id=None):
   Returns:
     copy: A set of Synsets of the same size as nodes.
   """
-  root_copy = None
-  copy = {}  # maps wn_id's to Synsets
-  parent_child_tuples = set()
+  words = {s.wn_id: s.words for s in nodes}
+  return copy_graph_from_edges(words, _enumerate_edges(nodes), root_wn_id)
+
 
+def _enumerate_edges(nodes):
+  """Return a list of the (parent wn_id, child wn_id) edges of nodes.
+  This assumes that nodes is an 'isolated' graph, as in copy_graph.
+  """
+  edges = []
   for s in nodes:
-    copy[s.wn_id] = Synset(s.wn_id, s.words, set(), set())
-    if root_wn_id is not None and s.wn_id == root_wn_id:
-      root_copy = copy[s.wn_id]
     for c in s.children:
       assert c in nodes
-      parent_child_tuples.add((s.wn_id, c.wn_id))
+      edges.append((s.wn_id, c.wn_id))
+  return edges
+
+
+def copy_graph_from_edges(words, edges, root_wn_id=None):
+  """Create a set of new Synsets wired according to the given edges.
+  Args:
+    words: A dict mapping the WordNet id of each node of the graph to its word
+      description.
+    edges: A list of (parent wn_id, child wn_id) tuples, as returned by
+      _enumerate_edges.
+    root_wn_id: Optionally, the wn_id field of the Synset that is intended to
+      eventually be the root of the new graph.
+  Returns:
+    copy: A set of Synsets, one for each key of words.
+    root_copy: The new Synset whose wn_id is root_wn_id, or None.
+  """
+  copy = {}  # maps wn_id's to Synsets
+  for wn_id, synset_words in words.items():
+    copy[wn_id] = Synset(wn_id, synset_words, set(), set())
+  root_copy = copy.get(root_wn_id) if root_wn_id is not None else None
 
   # Add the analogous parent/child relations between nodes in
-  # copy as those that existed in nodes
-  for parent, child in parent_child_tuples:
+  # copy as those that existed in the original graph
+  for parent, child in edges:
     copy[parent].children.add(copy[child])
     copy[child].parents.add(copy[parent])
 
@@ -527,12 +600,19 @@ def create_splits(spanning_leaves, split_enum, valid_test_roots=None, **kwargs):
   return split_graphs, roots
 
 
-def get_synset_by_wnid(wnid, graph):
-  """Return the synset of sampling_graph whose WordNet id is wnid."""
-  for n in graph:
-    if n.wn_id == wnid:
-      return n
-  return None
+def get_synset_by_wnid(wnid, graph, wnid_index=None):
+  """Return the synset of sampling_graph whose WordNet id is wnid.
+  Args:
+    wnid: A WordNet id.
+    graph: A set of Synsets.
+    wnid_index: Optionally, a dict as returned by build_wnid_index(graph). It
+      should be provided when doing several lookups in the same graph.
+  Returns:
+    The Synset with WordNet id wnid, or None if there is no such Synset.
+  """
+  if wnid_index is None:
+    wnid_index = build_wnid_index(graph)
+  return wnid_index.get(wnid)
 
 
 def is_descendent(d, a):
@@ -542,10 +622,22 @@ def is_descendent(d, a):
     d: A Synset.
     a: A Synset.
   """
-  paths = get_upward_paths_from(d, end=a)
-  # The second clause ensures that a node is not a descendent of itself (our
-  # graphs are DAGs so this suffices to enforce this).
-  return len(paths) and not (len(paths) == 1 and len(paths[0]) == 1)
+  # Our graphs are DAGs, so a node can never reach itself going upwards.
+  if d is a:
+    return False
+  # Only reachability matters here, so stop at the first time a is met instead
+  # of enumerating all upward paths from d.
+  seen = {d}
+  stack = list(d.parents)
+  while stack:
+    n = stack.pop()
+    if n is a:
+      return True
+    if n in seen:
+      continue
+    seen.add(n)
+    stack.extend(n.parents)
+  return False
 
 
 def get_upward_paths_from(start, end=None):
@@ -568,30 +660,31 @@ def get_upward_paths_from(start, end=None):
     # There are no upwards paths from start in which the specified end can be.
     return []
 
-  if is_end_node(start):
-    return [[start]]
-
-  # If we got here, we haven't yet reached the target node and there are upward
-  # paths to explore.
-  parents = start.parents
-
-  # A list of all paths from start to end (or to a root node).
-  paths = []
-
-  # Case where end is a direct parent of start:
-  for p in parents:
-    if is_end_node(p):
-      # Found one path from start to end.
-      paths.append([start, p])
-
-    else:
-      # Get a list of lists corresponding to paths between p and end.
-      p_to_end_paths = get_upward_paths_from(p, end=end)
-      if not p_to_end_paths:  # end not an ancestor of p.
-        continue
-      start_to_end_paths = [[start] + p_path for p_path in p_to_end_paths]
-      paths.extend(start_to_end_paths)
-  return paths
+  # Maps each visited node to a tuple of its paths to end (or to a root), each
+  # path being a tuple. Shared ancestors are thus only expanded once, instead of
+  # once for every path that leads to them.
+  paths_from = {}
+  stack = [start]
+  while stack:
+    n = stack[-1]
+    if n in paths_from:
+      stack.pop()
+      continue
+    if is_end_node(n):
+      paths_from[n] = ((n,),)
+      stack.pop()
+      continue
+    # Parents whose paths still have to be computed. Nodes without parents that
+    # are not the end are resolved right away, as no path goes through them.
+    unresolved = [p for p in n.parents if p not in paths_from]
+    if unresolved:
+      stack.extend(unresolved)
+      continue
+    stack.pop()
+    paths_from[n] = tuple(
+        (n,) + p_path for p in n.parents for p_path in paths_from[p])
+
+  return [list(path) for path in paths_from[start]]
 
 
 def find_lowest_common_in_paths(path_a, path_b):
@@ -608,24 +701,27 @@ def find_lowest_common_in_paths(path_a, path_b):
       path_a and path_b.
     height: The height of lowest_common, computed as described above.
   """
-  # Maps elements that appear in both lists to their heights.
-  common_elements, heights = [], []
-  for element in path_a:
-    if element in path_b:
-      height = max(path_a.index(element), path_b.index(element))
-      common_elements.append(element)
-      heights.append(height)
-
-  if not heights:
-    raise ValueError('No common nodes in given paths {} and {}.'.format(
-        [n.words for n in path_a], [n.words for n in path_b]))
+  # Maps each element of path_b to the first position where it occurs.
+  positions_b = {}
+  for index_b, element in enumerate(path_b):
+    positions_b.setdefault(element, index_b)
 
   # Find the lowest common element.
   # There may be multiple common ancestors that share the same minimal height.
-  # In that case the first one appearing in common_elements will be returned.
-  min_height = min(heights)
-  argmin_height = heights.index(min_height)
-  lowest_common = common_elements[argmin_height]
+  # In that case the first one appearing in path_a will be returned.
+  lowest_common, min_height = None, None
+  for index_a, element in enumerate(path_a):
+    index_b = positions_b.get(element)
+    if index_b is None:
+      continue
+    height = max(index_a, index_b)
+    if min_height is None or height < min_height:
+      lowest_common, min_height = element, height
+
+  if min_height is None:
+    raise ValueError('No common nodes in given paths {} and {}.'.format(
+        [n.words for n in path_a], [n.words for n in path_b]))
+
   assert min_height > 0, ('The lowest common ancestor between two distinct '
                           'leaves cannot be a leaf.')
   return lowest_common, min_height
@@ -662,8 +758,8 @@ def get_lowest_common_ancestor(leaf_a, leaf_b, path='longest'):
   # root (and analogously for paths_b). We pick the longest path of each list of
   # paths and find the lowest common ancestor between those two paths.
   if path == 'longest':
-    path_a = paths_a[np.argmax([len(path_a) for path_a in paths_a])]
-    path_b = paths_b[np.argmax([len(path_b) for path_b in paths_b])]
+    path_a = max(paths_a, key=len)
+    path_b = max(paths_b, key=len)
     lca, height_of_lca = find_lowest_common_in_paths(path_a, path_b)
 
   else:
@@ -709,20 +805,31 @@ def get_num_synset_2012_images(root, path, synsets_2012, files_to_skip=None):
   logging.info('Unsuccessful. Deriving number of leaf images...')
   if files_to_skip is None:
     files_to_skip = set()
+  # Skipped files are only collected when they are going to be logged.
+  log_skipped = logging.getLogger().isEnabledFor(logging.INFO)
   num_synset_2012_images = {}
   for s_2012 in synsets_2012:
     synset_dir = os.path.join(root, s_2012.wn_id)
-    all_files = set(os.listdir(synset_dir))
-    img_files = set([f for f in all_files if f.lower().endswith('jpeg')])
-    final_files = img_files - files_to_skip
-    skipped_files = all_files - final_files
+    num_images = 0
+    skipped_files = set()
+    with os.scandir(synset_dir) as entries:
+      for entry in entries:
+        name = entry.name
+        if name.lower().endswith('jpeg') and name not in files_to_skip:
+          num_images += 1
+        elif log_skipped:
+          skipped_files.add(name)
     if skipped_files:
       logging.info('Synset: %s, files_skipped: %s', s_2012.wn_id, skipped_files)
-    # Size of the set difference (-) between listed files and `files_to_skip`.
-    num_synset_2012_images[s_2012.wn_id] = len(final_files)
+    # Number of listed image files that are not in `files_to_skip`.
+    num_synset_2012_images[s_2012.wn_id] = num_images
 
   if path:
-    with open(path, 'w') as f:
-      json.dump(num_synset_2012_images, f, indent=2)
+    # Write compactly to a temporary file first, so that an interrupted run
+    # never leaves a truncated cache behind to be read next time.
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+      json.dump(num_synset_2012_images, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
 
   return num_synset_2012_images
@@ -888,10 +888,13 @@ def create_ImageNet_spec(root,
     # Create class splits, each with its own sampling graph.
     # Choose roots for the validation and test subtrees (see the docstring of
     # create_splits for more information on how these are used).
+    wnid_index = build_wnid_index(sampling_graph)
     valid_test_roots = {
-        'valid': get_synset_by_wnid('n02075296', sampling_graph),  # 'carnivore'
+        'valid': get_synset_by_wnid('n02075296', sampling_graph,
+                                    wnid_index),  # 'carnivore'
         'test':
-            get_synset_by_wnid('n03183080', sampling_graph)  # 'device'
+            get_synset_by_wnid('n03183080', sampling_graph,
+                               wnid_index)  # 'device'
     }
     # The valid_test_roots returned here correspond to the same Synsets as in
     # the above dict, but are the copied versions of them for each subgraph.
@@ -1,6 +1,8 @@
-import yaml
 import os
 import sys
+import json
+import io
+import tarfile
 
 all_roots = {}
 all_roots["imagenet"] = "PATH-TO-IMAGENET" #0
@@ -28,6 +30,35 @@ Data["IS_TRAIN"] = 0
 names = list(all_roots.keys())
 roots = list(all_roots.values())
 
+ROOT_PLACEHOLDER = '__DATASET_ROOT__'
+NAME_PLACEHOLDER = '__DATASET_NAME__'
+TYPE_PLACEHOLDER = '__MODEL_TYPE__'
+CLASSIFIER_PLACEHOLDER = '__CLASSIFIER__'
+PARAMETERS_PLACEHOLDER = '__CLASSIFIER_PARAMETERS__'
+
+# Substitute the placeholders of a dumped config with their values.
+def fill_template(template, values):
+   for placeholder, value in values.items():
+      template = template.replace(json.dumps(placeholder), json.dumps(value))
+   return template
+
+# Leave the file untouched if it already holds this config, e.g. on a re-run.
+def write_config(path, text):
+   try:
+      with open(path) as f:
+         if f.read() == text:
+            return
+   except FileNotFoundError:
+      pass
+   # the whole config is in memory: write it without a buffered file object
+   data = text.encode()
+   fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+   try:
+      while data:
+         data = data[os.write(fd, data):]
+   finally:
+      os.close(fd)
+
 
 Data["DATA"]["TEST"] = {}
 
@@ -81,25 +112,26 @@ Data["AUG"] = {}
 Data["AUG"]["MEAN"] = [0.4712, 0.4499, 0.4031]
 Data["AUG"]["STD"] = [0.2726, 0.2634, 0.2794]
 
-# ImageNet
-# Data["DATA"]["IMG_SIZE"] = 224
+# image size and backbone of each pretrained model
+PRESETS = {}
+PRESETS['clip'] = {"IMG_SIZE": 224,
+                   "MODEL": {"BACKBONE": 'clip'}}
+PRESETS['dino'] = {"IMG_SIZE": 224,
+                   "MODEL": {"BACKBONE": 'DINO_ViT',
+                             "BACKBONE_HYPERPARAMETERS": ['base', 16],
+                             "PRETRAINED": '/home/anonymous/Documents/models/DINO/dino_vitbase16_pretrain.pth'}}
+PRESETS['dinov2'] = {"IMG_SIZE": 224,
+                     "MODEL": {"BACKBONE": 'DINO_v2',
+                               "BACKBONE_HYPERPARAMETERS": ['dinov2_vitb14_reg']}}
 
 # miniImageNet
-Data["DATA"]["IMG_SIZE"] = 84
-Data["DATA"]["IMG_SIZE"] = 224
+# Data["DATA"]["IMG_SIZE"] = 84
 #Data["MODEL"]["BACKBONE"] = 'resnet12'
-# Data["MODEL"]["BACKBONE"] = '
-# resnet50'
 model=sys.argv[1]
-if model == 'clip':
-   Data["MODEL"]["BACKBONE"] = 'clip'
-elif model == 'dino':
-   Data["MODEL"]["BACKBONE"] = 'DINO_ViT'
-   Data["MODEL"]["BACKBONE_HYPERPARAMETERS"] = ['base', 16]
-   Data["MODEL"]["PRETRAINED"] = '/home/anonymous/Documents/models/DINO/dino_vitbase16_pretrain.pth'
-elif model=='dinov2':
-   Data["MODEL"]["BACKBONE"] = 'DINO_v2'
-   Data["MODEL"]["BACKBONE_HYPERPARAMETERS"] = ['dinov2_vitb14_reg']
+if model not in PRESETS:
+   sys.exit('model not found')
+Data["DATA"]["IMG_SIZE"] = PRESETS[model]["IMG_SIZE"]
+Data["MODEL"].update(PRESETS[model]["MODEL"])
 
 
 #Data["MODEL"]["PRETRAINED"] = '/home/anonymous/Documents/models/ce_miniImageNet_res12.pth'# for example
@@ -132,37 +164,62 @@ Data["DATA"]["TEST"]["EPISODE_DESCR_CONFIG"]["NUM_TASKS_PER_EPOCH"] = 2000
 #Data["MODEL"]["CLASSIFIER"] = "proto_head"
 #Data["MODEL"]["CLASSIFIER"] = "MatchingNet"
 S = Data["DATA"]["TEST"]["EPISODE_DESCR_CONFIG"]["NUM_SUPPORT"]
-os.makedirs('./configs/benchmark/{}-shot'.format(S,model),exist_ok=True)
-os.makedirs('./configs/benchmark/{}-shot/{}'.format(S,model),exist_ok=True)
+root_dir = './configs/benchmark/{}-shot/{}'.format(S,model)
+# with --tar, all the configs go into a single <root_dir>.tar archive instead of one file each
+archive = '--tar' in sys.argv[2:]
 list_methods  = ['NCC', 'finetune', 'LR', 'matchingnet', 'protohead']
+# (TYPE, CLASSIFIER, CLASSIFIER_PARAMETERS) of each method; the parameters are
+# given per model when they depend on it
+METHOD_CFG = {}
+METHOD_CFG['NCC'] = ("fewshot_finetune", "finetune", [100,100,0,0.0,0.0,False,False,"NCC"])
+METHOD_CFG['finetune'] = ("fewshot_finetune", "finetune", {'clip': [100,100,30,0.0001,0.1,False,False,"fc"],
+                                                           'dino': [100,100,30,0.001,0.1,False,False,"fc"],
+                                                           'dinov2': [100,100,30,0.0001,0.1,False,False,"fc"]})
+METHOD_CFG['LR'] = ("Episodic_Model", "LR", [])
+METHOD_CFG['matchingnet'] = ("Episodic_Model", "MatchingNet", [])
+METHOD_CFG['protohead'] = ("Episodic_Model", "proto_head", [])
+# Only the method and dataset fields change between the files: dump the config
+# once with placeholders for them and fill them in for each file. Data itself is
+# not modified.
+cfg = {**Data,
+       "MODEL": {**Data["MODEL"],
+                 "TYPE": TYPE_PLACEHOLDER,
+                 "CLASSIFIER": CLASSIFIER_PLACEHOLDER,
+                 "CLASSIFIER_PARAMETERS": PARAMETERS_PLACEHOLDER},
+       "DATA": {**Data["DATA"],
+                "TEST": {**Data["DATA"]["TEST"],
+                         "DATASET_ROOTS": [ROOT_PLACEHOLDER],
+                         "DATASET_NAMES": [NAME_PLACEHOLDER]}}}
+template = json.dumps(cfg, indent=2, sort_keys=True)
+
+# (path, text) of every config file to write
+tasks = []
 for method in list_methods:
-   if method in ['NCC', 'finetune']:
-      Data["MODEL"]["TYPE"] = "fewshot_finetune"
-      Data["MODEL"]["CLASSIFIER"] = "finetune"
-      if method == 'NCC':
-         Data["MODEL"]["CLASSIFIER_PARAMETERS"] = [100,100,0,0.0,0.0,False,False,"NCC"]
-      elif method == 'finetune':
-         if model == 'clip':
-            Data["MODEL"]["CLASSIFIER_PARAMETERS"] = [100,100,30,0.0001,0.1,False,False,"fc"]
-         elif model == 'dino':
-            Data["MODEL"]["CLASSIFIER_PARAMETERS"] = [100,100,30,0.001,0.1,False,False,"fc"]
-         elif model == 'dinov2':
-            Data["MODEL"]["CLASSIFIER_PARAMETERS"] = [100,100,30,0.0001,0.1,False,False,"fc"]
-   elif method == 'LR':
-      Data["MODEL"]["TYPE"] = "Episodic_Model"
-      Data["MODEL"]["CLASSIFIER"] = "LR"
-      Data["MODEL"]["CLASSIFIER_PARAMETERS"]=[]
-   elif method == 'matchingnet':
-      Data["MODEL"]["TYPE"] = "Episodic_Model"
-      Data["MODEL"]["CLASSIFIER"] = "MatchingNet"
-      Data["MODEL"]["CLASSIFIER_PARAMETERS"]=[]
+   model_type, classifier, classifier_parameters = METHOD_CFG[method]
+   if isinstance(classifier_parameters, dict):
+      classifier_parameters = classifier_parameters[model]
 
+   method_template = fill_template(template, {TYPE_PLACEHOLDER: model_type,
+                                              CLASSIFIER_PLACEHOLDER: classifier,
+                                              PARAMETERS_PLACEHOLDER: classifier_parameters})
+
+   out_dir = root_dir + '/' + method
+   if not archive:
+      os.makedirs(out_dir, exist_ok=True)
    for i in range(1,10):
       dataset = names[i]
-      Data["DATA"]["TEST"]["DATASET_ROOTS"] = [roots[i]]
-      Data["DATA"]["TEST"]["DATASET_NAMES"] = [dataset]
-
-      if not os.path.exists('./configs/benchmark/{}-shot/{}/{}'.format(S,model,method)):
-         os.makedirs('./configs/benchmark/{}-shot/{}/{}'.format(S,model,method))
-      with open('./configs/benchmark/{}-shot/{}/{}/{}.yaml'.format(S,model,method,dataset), 'w') as f:
-         yaml.dump(data=Data, stream=f)
\ No newline at end of file
+      text = fill_template(method_template, {ROOT_PLACEHOLDER: roots[i], NAME_PLACEHOLDER: dataset})
+      tasks.append((out_dir + '/' + dataset + '.yaml', text))
+
+# All configs are rendered at this point and the files are independent.
+if archive:
+   os.makedirs(os.path.dirname(root_dir), exist_ok=True)
+   with tarfile.open(root_dir + '.tar', 'w') as tar:
+      for path, text in tasks:
+         data = text.encode()
+         info = tarfile.TarInfo(os.path.relpath(path, root_dir))
+         info.size = len(data)
+         tar.addfile(info, io.BytesIO(data))
+else:
+   for path, text in tasks:
+      write_config(path, text)
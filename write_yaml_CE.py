@@ -1,5 +1,5 @@
-import yaml
 import os
+import json
 
 Data = {}
 Data["DATA"] = {}
@@ -65,8 +65,9 @@ Data["TRAIN"]["BASE_LR"] = 0.1*Data["DATA"]["TRAIN"]["BATCH_SIZE"]/128
 
 
 
-if not os.path.exists('./configs/CE'):
-   os.makedirs('./configs/CE')
+os.makedirs('./configs/CE', exist_ok=True)
 
+# Serialize in memory first so the file is written with a single call.
+text = json.dumps(Data, indent=2, sort_keys=True)
 with open('./configs/CE/miniImageNet_res12.yaml', 'w') as f:
-   yaml.dump(data=Data, stream=f)
\ No newline at end of file
+   f.write(text)
\ No newline at end of file
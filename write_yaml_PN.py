@@ -73,8 +73,7 @@ Data["DATA"]["TRAIN"]["EPISODE_DESCR_CONFIG"]["NUM_TASKS_PER_EPOCH"] = 1000
 
 
 
-if not os.path.exists('./configs/PN'):
-   os.makedirs('./configs/PN')
+os.makedirs('./configs/PN', exist_ok=True)
 
 with open('./configs/PN/miniImageNet_res12.yaml', 'w') as f:
    yaml.dump(data=Data, stream=f)
\ No newline at end of file
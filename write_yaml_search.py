@@ -1,5 +1,5 @@
-import yaml
 import os
+import json
 
 all_roots = {}
 all_roots["ILSVRC"] = "PATH-TO-IMAGENET" #0
@@ -100,7 +100,8 @@ Data["SEARCH_HYPERPARAMETERS"]["LR_BACKBONE_RANGE"] = [0.01,0.05,0.25]
 Data["SEARCH_HYPERPARAMETERS"]["LR_HEAD_RANGE"] = [0.02,0.1,0.5]
 Data["SEARCH_HYPERPARAMETERS"]["EPOCH_RANGE"] = [10,20,30]
 
-if not os.path.exists('./configs/search'):
-   os.makedirs('./configs/search')
+os.makedirs('./configs/search', exist_ok=True)
+# Serialize in memory first so the file is written with a single call.
+text = json.dumps(Data, indent=2, sort_keys=True)
 with open('./configs/search/finetune_clip.yaml', 'w') as f:
-   yaml.dump(data=Data, stream=f)
\ No newline at end of file
+   f.write(text)
\ No newline at end of file
@@ -124,7 +124,6 @@ Data["MODEL"]["CLASSIFIER_PARAMETERS"] = [100,100,10,0.02,0.1,False,False,"fc"]#
 #Data["MODEL"]["CLASSIFIER"] = "proto_head"
 #Data["MODEL"]["CLASSIFIER"] = "MatchingNet"
 
-if not os.path.exists('./configs/evaluation'):
-   os.makedirs('./configs/evaluation')
+os.makedirs('./configs/evaluation', exist_ok=True)
 with open('./configs/evaluation/finetune_res12_CC.yaml', 'w') as f:
    yaml.dump(data=Data, stream=f)
\ No newline at end of file
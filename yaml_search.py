@@ -1,6 +1,6 @@
-import yaml
 import os
 import sys
+import json
 
 all_roots = {}
 all_roots["imagenet"] = "PATH-TO-IMAGENET" #0
@@ -28,6 +28,15 @@ Data["IS_TRAIN"] = 0
 names = list(all_roots.keys())
 roots = list(all_roots.values())
 
+ROOT_PLACEHOLDER = '__DATASET_ROOT__'
+NAME_PLACEHOLDER = '__DATASET_NAME__'
+
+# Substitute the placeholders of a dumped config with their values.
+def fill_template(template, values):
+   for placeholder, value in values.items():
+      template = template.replace(json.dumps(placeholder), json.dumps(value))
+   return template
+
 
 Data["DATA"]["VALID"] = {}
 
@@ -82,27 +91,26 @@ Data["AUG"] = {}
 Data["AUG"]["MEAN"] = [0.4712, 0.4499, 0.4031]
 Data["AUG"]["STD"] = [0.2726, 0.2634, 0.2794]
 
-# ImageNet
-# Data["DATA"]["IMG_SIZE"] = 224
+# image size and backbone of each pretrained model
+PRESETS = {}
+PRESETS['clip'] = {"IMG_SIZE": 224,
+                   "MODEL": {"BACKBONE": 'clip'}}
+PRESETS['dino'] = {"IMG_SIZE": 224,
+                   "MODEL": {"BACKBONE": 'DINO_ViT',
+                             "BACKBONE_HYPERPARAMETERS": ['base', 16],
+                             "PRETRAINED": '/home/anonymous/Documents/models/DINO/dino_vitbase16_pretrain.pth'}}
+PRESETS['dinov2'] = {"IMG_SIZE": 224,
+                     "MODEL": {"BACKBONE": 'DINO_v2',
+                               "BACKBONE_HYPERPARAMETERS": ['dinov2_vitb14_reg']}}
 
 # miniImageNet
-Data["DATA"]["IMG_SIZE"] = 84
-Data["DATA"]["IMG_SIZE"] = 224
+# Data["DATA"]["IMG_SIZE"] = 84
 #Data["MODEL"]["BACKBONE"] = 'resnet12'
-# Data["MODEL"]["BACKBONE"] = '
-# resnet50'
 model=sys.argv[1]
-if model == 'clip':
-   Data["MODEL"]["BACKBONE"] = 'clip'
-elif model == 'dino':
-   Data["MODEL"]["BACKBONE"] = 'DINO_ViT'
-   Data["MODEL"]["BACKBONE_HYPERPARAMETERS"] = ['base', 16]
-   Data["MODEL"]["PRETRAINED"] = '/home/anonymous/Documents/models/DINO/dino_vitbase16_pretrain.pth'
-elif model =='dinov2':
-   Data["MODEL"]["BACKBONE"] = 'DINO_v2'
-   Data["MODEL"]["BACKBONE_HYPERPARAMETERS"] =  ['dinov2_vitb14_reg']
-else:
+if model not in PRESETS:
    sys.exit('model not found')
+Data["DATA"]["IMG_SIZE"] = PRESETS[model]["IMG_SIZE"]
+Data["MODEL"].update(PRESETS[model]["MODEL"])
 
 #Data["MODEL"]["PRETRAINED"] = '/home/anonymous/Documents/models/ce_miniImageNet_res12.pth'# for example
 
@@ -144,16 +152,17 @@ Data['SEARCH_HYPERPARAMETERS']['LR_HEAD_RANGE'] = [0.0001, 0.001,0.01,0.1]
 
 
 
+# Only the dataset changes between the files: dump the config once with
+# placeholders and fill them in for each dataset.
+Data["DATA"]["VALID"]["DATASET_ROOTS"] = [ROOT_PLACEHOLDER]
+Data["DATA"]["VALID"]["DATASET_NAMES"] = [NAME_PLACEHOLDER]
+template = json.dumps(Data, indent=2, sort_keys=True)
+
+out_dir = './configs/search/exps/{}_wr/{}'.format(model,method)
+os.makedirs(out_dir, exist_ok=True)
 for i in range(1,10):
    dataset = names[i]
-   Data["DATA"]["VALID"]["DATASET_ROOTS"] = [roots[i]]
-   Data["DATA"]["VALID"]["DATASET_NAMES"] = [dataset]
-
-   if not os.path.exists('./configs/search/exps/{}_wr/{}'.format(model,method)):
-      try:
-         os.makedirs('./configs/search/exps/{}_wr'.format(model))
-      except:
-         pass
-      os.makedirs('./configs/search/exps/{}_wr/{}'.format(model,method))
-   with open('./configs/search/exps/{}_wr/{}/{}.yaml'.format(model,method,dataset), 'w') as f:
-      yaml.dump(data=Data, stream=f)
\ No newline at end of file
+   text = fill_template(template, {ROOT_PLACEHOLDER: roots[i], NAME_PLACEHOLDER: dataset})
+
+   with open('{}/{}.yaml'.format(out_dir,dataset), 'w') as f:
+      f.write(text)
\ No newline at end of file